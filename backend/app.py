@@ -1,54 +1,154 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, has_request_context, jsonify, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
-from backend.models import db, User, Habit, HabitCompletion
+from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_current_user
+from flask_migrate import Migrate
+from backend.models import db, User, Habit, HabitCompletion, weekday_mask
 from backend.config import Config
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, raiseload
+from cachetools import TTLCache, cached
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
 from datetime import timedelta, date, datetime
+import orjson
 import os
+import re
+import threading
+
+_password_hasher = PasswordHasher(
+    time_cost=Config.ARGON2_TIME_COST,
+    memory_cost=Config.ARGON2_MEMORY_COST,
+    parallelism=Config.ARGON2_PARALLELISM
+)
+
+# Verified against when a login names an unknown email, so misses take as long as wrong passwords
+_DUMMY_PASSWORD_HASH = _password_hasher.hash('dummy-password')
+
+# Password hashing is deliberately slow; running it on a small pool caps how many request
+# threads can be burning a core on it at once. Each gunicorn worker process has its own pool,
+# so the cores are split between them (gunicorn.conf.py exports GUNICORN_WORKERS)
+_password_pool = ThreadPoolExecutor(
+    max_workers=max(1, (os.cpu_count() or 1) // int(os.environ.get('GUNICORN_WORKERS', 1))),
+    thread_name_prefix='password'
+)
+
+def hash_password(password):
+    """Hash a password with Argon2id"""
+    return _password_pool.submit(_password_hasher.hash, password).result()
+
+def hash_passwords(passwords):
+    """Hash several passwords concurrently on the password pool"""
+    return list(_password_pool.map(_password_hasher.hash, passwords))
+
+def verify_password(password_hash, password):
+    """Check a password against its stored hash, accepting legacy werkzeug PBKDF2 hashes"""
+    return _password_pool.submit(_verify_password, password_hash, password).result()
+
+def password_needs_rehash(password_hash):
+    """Whether a stored hash is legacy PBKDF2 or uses outdated Argon2 parameters"""
+    if not password_hash.startswith('$argon2'):
+        return True
+    try:
+        return _password_hasher.check_needs_rehash(password_hash)
+    except InvalidHashError:
+        return True
+
+def _verify_password(password_hash, password):
+    if password_hash.startswith('$argon2'):
+        try:
+            return _password_hasher.verify(password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    return check_password_hash(password_hash, password)
+
+# Something@domain.tld with no spaces, checked in one pass
+_EMAIL_RE = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
+
+def normalize_email(email):
+    """Return the email trimmed and lowercased as login expects, or None if it isn't a valid address"""
+    if not isinstance(email, str):
+        return None
+    email = email.strip().lower()
+    return email if _EMAIL_RE.fullmatch(email) else None
+
+# Emails recently seen as registered, so repeat signups skip hashing and the INSERT
+_taken_emails = TTLCache(maxsize=10000, ttl=30)
+_taken_emails_lock = threading.Lock()
+
+def is_email_known_taken(email):
+    """Check whether an email was recently seen as already registered"""
+    with _taken_emails_lock:
+        return email in _taken_emails
+
+def remember_email_taken(email):
+    """Record that an email is registered"""
+    with _taken_emails_lock:
+        _taken_emails[email] = True
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that serializes with orjson instead of the stdlib json module"""
+    option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response to skip the str round-trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.option),
+            mimetype=self.mimetype
+        )
+
+# Precomputed Argon2id hash of 'password' for the seeded test user, so seeding skips the KDF.
+# Made with the default ARGON2_* settings so logins don't trigger a rehash; regenerate if they change
+_TEST_USER_PASSWORD_HASH = '$argon2id$v=19$m=19456,t=2,p=1$LrmYXDJyb3+JY7SDO30ryA$8APry4cw/KYOBuzwZmuRQuQuQpoe8DAmABHOldvLKEc'
 
 def initialize_database():
     """Initialize database and create test user and sample habits if not exists"""
     try:
-        # Check if test user exists
-        test_user = User.query.filter_by(email='test@example.com').first()
-        if not test_user:
-            # Create test user with hashed password
-            password_hash = generate_password_hash('password')
-            test_user = User(email='test@example.com', password_hash=password_hash)
-            db.session.add(test_user)
-            db.session.commit()
+        # Create test user with hashed password, leaving an existing row untouched
+        result = db.session.execute(
+            pg_insert(User)
+            .values(email='test@example.com', password_hash=_TEST_USER_PASSWORD_HASH)
+            .on_conflict_do_nothing(index_elements=['email'])
+        )
+        db.session.commit()
+        if result.rowcount:
             print("Test user created successfully")
         else:
             print("Test user already exists")
+        test_user_id = db.session.execute(
+            db.select(User.id).where(User.email == 'test@example.com')
+        ).scalar_one()
         
         # Check if test user has any habits, if not create sample habits
-        user_habits = Habit.query.filter_by(user_id=test_user.id).first()
-        if not user_habits:
+        has_habits = db.session.execute(
+            db.select(db.exists().where(Habit.user_id == test_user_id))
+        ).scalar()
+        if not has_habits:
+            # One executemany INSERT; the unique_id and streak column defaults fill the rest
             sample_habits = [
-                Habit(
-                    user_id=test_user.id,
-                    name='Drink 2L water daily',
-                    target_days='every_day',
-                    start_date=date(2025, 5, 1)
-                ),
-                Habit(
-                    user_id=test_user.id,
-                    name='Read for 30 minutes',
-                    target_days='every_day',
-                    start_date=date(2025, 5, 10)
-                ),
-                Habit(
-                    user_id=test_user.id,
-                    name='Exercise for 1 hour',
-                    target_days='weekdays',
-                    start_date=date(2025, 5, 15)
-                )
+                {'name': 'Drink 2L water daily', 'target_days': 'every_day', 'start_date': date(2025, 5, 1)},
+                {'name': 'Read for 30 minutes', 'target_days': 'every_day', 'start_date': date(2025, 5, 10)},
+                {'name': 'Exercise for 1 hour', 'target_days': 'weekdays', 'start_date': date(2025, 5, 15)}
             ]
-            
-            for habit in sample_habits:
-                db.session.add(habit)
-            
+            db.session.execute(
+                db.insert(Habit),
+                [
+                    dict(habit, user_id=test_user_id, target_weekday_mask=weekday_mask(habit['target_days']))
+                    for habit in sample_habits
+                ]
+            )
             db.session.commit()
             print("Sample habits created for test user")
         else:
@@ -58,11 +158,75 @@ def initialize_database():
         print(f"Error initializing database: {e}")
         db.session.rollback()
 
-def calculate_current_streak(habit):
+def completed_habit_ids(habit_ids, completion_date):
+    """Ids of the given habits completed on a date, selecting only the id column"""
+    if not habit_ids:
+        return set()
+    return set(db.session.scalars(db.select(HabitCompletion.habit_id).where(
+        HabitCompletion.habit_id.in_(habit_ids),
+        HabitCompletion.completion_date == completion_date
+    )))
+
+def get_user_habit(habit_id, user_id, *options):
+    """Fetch a habit only if it belongs to the given user, applying any loader options"""
+    return db.session.scalar(
+        db.select(Habit).where(Habit.id == habit_id, Habit.user_id == user_id).options(*options)
+    )
+
+def get_user_habits_with_completions(user_id, completion_date):
+    """Fetch a user's habits with a {habit_id: completed_at} map for a date, in one outer-joined query"""
+    rows = db.session.execute(
+        db.select(Habit, HabitCompletion.completed_at)
+        .outerjoin(HabitCompletion, db.and_(
+            HabitCompletion.habit_id == Habit.id,
+            HabitCompletion.completion_date == completion_date
+        ))
+        .where(Habit.user_id == user_id)
+    ).all()
+    habits = [habit for habit, _ in rows]
+    today_map = {habit.id: completed_at for habit, completed_at in rows if completed_at is not None}
+    return habits, today_map
+
+def due_habit_ids(user_id, check_date):
+    """Ids of a user's habits due on a date, filtered in SQL on start date and weekday mask"""
+    return tuple(db.session.scalars(db.select(Habit.id).where(
+        Habit.user_id == user_id,
+        Habit.start_date <= check_date,
+        Habit.target_weekday_mask.op('&')(1 << check_date.weekday()) != 0
+    )))
+
+def _resolve_local_date(local_date_str):
+    """Parse the client's YYYY-MM-DD local date, falling back to the server date"""
+    if local_date_str:
+        try:
+            return datetime.strptime(local_date_str, '%Y-%m-%d').date()
+        except ValueError:
+            pass
+    return date.today()
+
+# Days of habit history encoded per streamed chunk
+HISTORY_BATCH_DAYS = 60
+
+# A habit's previous due day is always within the last week, so streaks only need
+# completions from this many days back
+STREAK_LOOKBACK_DAYS = 7
+
+def calculate_current_streak(habit, current_date=None):
     """Calculate streak based on previous day completion, then add today if completed"""
-    from datetime import date, timedelta, datetime
+    current_date = current_date or date.today()
     
-    current_date = date.today()
+    # One query for the recent completion dates; the streak walk then runs in memory
+    completed_dates = set(db.session.scalars(db.select(HabitCompletion.completion_date).where(
+        HabitCompletion.habit_id == habit.id,
+        HabitCompletion.completion_date >= current_date - timedelta(days=STREAK_LOOKBACK_DAYS),
+        HabitCompletion.completion_date <= current_date
+    )))
+    
+    return calculate_current_streak_from_set(habit, completed_dates, current_date)
+
+def calculate_current_streak_from_set(habit, completed_dates, current_date=None):
+    """Calculate the current streak against a preloaded set of completion dates"""
+    current_date = current_date or date.today()
     
     # Safety check - don't go back before habit start date
     habit_start = habit.start_date
@@ -79,42 +243,21 @@ def calculate_current_streak(habit):
     # Find the immediate previous day when habit was due
     while previous_date >= habit_start:
         if is_habit_due_on_date(habit, previous_date):
-            # Found the immediate previous assigned day
-            previous_completion = HabitCompletion.query.filter_by(
-                habit_id=habit.id,
-                completion_date=previous_date
-            ).first()
-            
-            if previous_completion:
-                # Previous day was completed - use current streak value
-                base_streak = habit.current_streak
-            else:
-                # Previous day was missed - reset to 0
-                base_streak = 0
+            # Previous day completed keeps the current streak, a miss resets it
+            base_streak = habit.current_streak if previous_date in completed_dates else 0
             break
         
         previous_date -= timedelta(days=1)
     
     # Step 2: If today is due and completed, add 1 to base streak
     if is_habit_due_on_date(habit, current_date):
-        today_completion = HabitCompletion.query.filter_by(
-            habit_id=habit.id,
-            completion_date=current_date
-        ).first()
-        
-        if today_completion:
-            return base_streak + 1
-        else:
-            # Due today but not completed
-            return 0
-    else:
-        # Not due today - return base streak
-        return base_streak
+        return base_streak + 1 if current_date in completed_dates else 0
+    
+    # Not due today - return base streak
+    return base_streak
 
 def is_habit_due_on_date(habit, check_date):
     """Check if a habit is due on a specific date based on target_days and start_date"""
-    from datetime import date, datetime
-    
     # Handle habit start date conversion
     habit_start = habit.start_date
     if isinstance(habit_start, str):
@@ -123,35 +266,27 @@ def is_habit_due_on_date(habit, check_date):
         except ValueError:
             return False
     
-    # Check if the date is on or after the habit start date
-    if check_date < habit_start:
-        return False
-    
-    # Get day of week (0=Monday, 6=Sunday in our backend format)
-    day_of_week = check_date.weekday()
-    
-    if habit.target_days == 'every_day':
-        return True
-    elif habit.target_days == 'weekdays':
-        return day_of_week < 5  # Monday to Friday
-    else:
-        # Handle custom days like "monday,wednesday,friday"
-        weekday_names = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-        today_name = weekday_names[day_of_week]
-        
-        if ',' in habit.target_days:
-            selected_days = [day.strip().lower() for day in habit.target_days.split(',')]
-            return today_name in selected_days
-        else:
-            return habit.target_days.lower() == today_name
+    return check_date >= habit_start and bool(habit.target_weekday_mask >> check_date.weekday() & 1)
 
 def recalculate_all_streaks():
     """Recalculate current streaks for all habits"""
     try:
+        today = date.today()
         habits = Habit.query.all()
+        
+        # Load the recent completions for every habit in one query
+        completed_dates = {}
+        recent_completions = db.session.query(
+            HabitCompletion.habit_id, HabitCompletion.completion_date
+        ).filter(
+            HabitCompletion.completion_date >= today - timedelta(days=STREAK_LOOKBACK_DAYS)
+        ).all()
+        for habit_id, completion_date in recent_completions:
+            completed_dates.setdefault(habit_id, set()).add(completion_date)
+        
         for habit in habits:
             old_streak = habit.current_streak
-            new_streak = calculate_current_streak(habit)
+            new_streak = calculate_current_streak_from_set(habit, completed_dates.get(habit.id, set()), today)
             if old_streak != new_streak:
                 habit.current_streak = new_streak
                 print(f"Updated habit '{habit.name}' streak from {old_streak} to {new_streak}")
@@ -161,13 +296,49 @@ def recalculate_all_streaks():
         print(f"Error recalculating streaks: {e}")
         db.session.rollback()
 
+def install_query_counter(app):
+    """Count each request's SQL statements and log the ones repeated past the threshold"""
+    threshold = app.config['DB_QUERY_LOG_N1_THRESHOLD']
+    
+    with app.app_context():
+        engine = db.engine
+    
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'sql_statements' in g:
+            g.sql_statements[statement] += 1
+    
+    @app.before_request
+    def start_query_count():
+        g.sql_statements = Counter()
+    
+    @app.after_request
+    def log_query_count(response):
+        statements = g.pop('sql_statements', None)
+        if statements:
+            repeated = [(count, statement) for statement, count in statements.items() if count > threshold]
+            if repeated:
+                app.logger.warning('%s %s ran %d queries', request.method, request.path, sum(statements.values()))
+                for count, statement in sorted(repeated, reverse=True):
+                    app.logger.warning('  %dx %s', count, ' '.join(statement.split()))
+        return response
+
+def install_raiseload():
+    """Add raiseload('*') to every ORM SELECT so relationships must be loaded explicitly"""
+    @event.listens_for(db.session, 'do_orm_execute')
+    def add_raiseload(orm_execute_state):
+        if orm_execute_state.is_select and not orm_execute_state.is_relationship_load:
+            orm_execute_state.statement = orm_execute_state.statement.options(raiseload('*'))
+
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.json = OrjsonProvider(app)
     
     # Initialize extensions
     db.init_app(app)
-    CORS(app, origins=['http://localhost:5000', 'http://localhost:3000'], 
+    Migrate(app, db)
+    CORS(app, origins=app.config['CORS_ORIGINS'], 
          methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
          allow_headers=['Content-Type', 'Authorization', 'Accept'],
          supports_credentials=True)
@@ -175,37 +346,45 @@ def create_app():
     # Initialize JWT
     jwt = JWTManager(app)
     
-    # Initialize database and create tables
-    with app.app_context():
-        db.create_all()
-        # initialize_database()  # Commented out to preserve cleaned data
+    @jwt.user_lookup_loader
+    def load_user_id(jwt_header, jwt_data):
+        # Parse the string identity once per request; handlers read it with get_current_user()
+        return int(jwt_data['sub'])
+    
+    # Development aid: log requests that repeat the same statement (usually an N+1 lazy load)
+    if app.debug or app.config['DB_QUERY_LOGGING']:
+        install_query_counter(app)
+    if app.config['DB_RAISELOAD']:
+        install_raiseload()
+    
+    # The schema is managed by migrations (`flask db upgrade`), not created on startup.
+    # Streaks are updated whenever a completion is written, so nothing is recalculated here.
+    
+    @app.cli.command('seed')
+    def seed_command():
+        """Create the test user and sample habits if they do not exist"""
+        initialize_database()
+    
+    @app.cli.command('recalc-streaks')
+    def recalc_streaks_command():
+        """Recalculate current streaks for all habits"""
         recalculate_all_streaks()
     
     # Helper function to update perfect day status
     def update_perfect_day_status(user_id, today):
-        """Update perfect day status for a user on a given date"""
-        user = User.query.get(user_id)
+        """Update perfect day status for a user on a given date and return whether it was achieved"""
+        user = db.session.get(User, user_id)
         if not user:
-            return
-        
-        # Get all habits due today for this user
-        user_habits = Habit.query.filter_by(user_id=user_id).all()
-        habits_due_today = [h for h in user_habits if h.is_due_today()]
+            return False
         
-        # Check if all habits due today are completed
-        all_completed = True
-        for due_habit in habits_due_today:
-            habit_completed = HabitCompletion.query.filter_by(
-                habit_id=due_habit.id,
-                completion_date=today
-            ).first()
-            if not habit_completed:
-                all_completed = False
-                break
+        # Check if all habits due on the given date are completed with a single query
+        habit_ids = due_habit_ids(user_id, today)
+        completed = completed_habit_ids(habit_ids, today)
+        all_completed = bool(habit_ids) and all(habit_id in completed for habit_id in habit_ids)
         
         # Update perfect day status
         today_str = today.isoformat()
-        if all_completed and len(habits_due_today) > 0:
+        if all_completed:
             # Add today to perfect days if not already there
             if not user.has_perfect_day(today_str):
                 user.add_perfect_day(today_str)
@@ -213,31 +392,20 @@ def create_app():
             # Remove today from perfect days if it was there but no longer complete
             if user.has_perfect_day(today_str):
                 user.remove_perfect_day(today_str)
+        
+        return all_completed
 
-    # Routes
-    @app.route('/api/hello', methods=['GET'])
-    def hello():
-        """Return a hello message from Flask backend"""
-        from datetime import datetime
-        return jsonify({
-            'message': 'Hello from Flask!',
-            'status': 'success',
-            'backend': 'Flask',
-            'database': 'PostgreSQL + SQLAlchemy',
-            'timestamp': datetime.now().isoformat()
-        })
+    # Constant response bodies, serialized once per app instead of per request
+    hello_prefix = orjson.dumps({
+        'message': 'Hello from Flask!',
+        'status': 'success',
+        'backend': 'Flask',
+        'database': 'PostgreSQL + SQLAlchemy'
+    })[:-1] + b',"timestamp":"'
     
-    @app.route('/api/status', methods=['GET'])
-    def status():
-        """Return backend status information"""
-        try:
-            # Test database connection
-            db.session.execute(db.text('SELECT 1'))
-            db_status = 'connected'
-        except Exception as e:
-            db_status = 'disconnected'
-            
-        return jsonify({
+    status_bodies = {}
+    for db_status in ('connected', 'disconnected'):
+        body = orjson.dumps({
             'backend': {
                 'framework': 'Flask',
                 'status': 'running',
@@ -254,18 +422,76 @@ def create_app():
                 'endpoints': ['/api/hello', '/api/status', '/api/users', '/api/register', '/api/login', '/api/protected', '/api/habits']
             }
         })
+        status_bodies[db_status] = body
+    
+    not_found_body = orjson.dumps({'error': 'Endpoint not found'})
+    internal_error_body = orjson.dumps({'error': 'Internal server error'})
+    
+    # Reuse the last ping result for a short window to skip the DB round trip
+    @cached(TTLCache(maxsize=1, ttl=app.config['STATUS_CACHE_SECONDS']), lock=threading.Lock())
+    def ping_database():
+        """Ping the database and report 'connected' or 'disconnected'"""
+        try:
+            db.session.execute(db.text('SELECT 1'))
+            return 'connected'
+        except Exception:
+            return 'disconnected'
+
+    # Routes
+    @app.route('/api/hello', methods=['GET'])
+    def hello():
+        """Return a hello message from Flask backend"""
+        timestamp = datetime.now().isoformat().encode()
+        return Response(hello_prefix + timestamp + b'"}', mimetype='application/json')
+    
+    @app.route('/api/status', methods=['GET'])
+    def status():
+        """Return backend status information"""
+        # No ETag here: the Express proxy doesn't forward conditional headers and sets its own
+        return Response(status_bodies[ping_database()], mimetype='application/json')
     
     @app.route('/api/users', methods=['GET'])
+    @jwt_required()
     def get_users():
-        """Get all users"""
+        """Get a page of users, streaming rows as they are read"""
         try:
-            users = User.query.all()
-            return jsonify({
-                'users': [user.to_dict() for user in users],
-                'count': len(users)
-            })
+            limit = min(int(request.args.get('limit', 100)), 1000)
+            offset = int(request.args.get('offset', 0))
+        except ValueError:
+            return jsonify({'error': 'limit and offset must be integers'}), 400
+        
+        if limit < 0 or offset < 0:
+            return jsonify({'error': 'limit and offset must not be negative'}), 400
+        
+        try:
+            # Count with an aggregate instead of loading every row to measure it
+            total = db.session.execute(db.select(db.func.count(User.id))).scalar_one()
         except Exception as e:
             return jsonify({'error': str(e)}), 500
+        
+        def generate():
+            # Query inside the generator: the session is torn down once the view returns.
+            # Selecting plain columns skips building a User instance per row.
+            rows = db.session.execute(
+                db.select(User.id, User.email, User.perfect_days_count)
+                .order_by(User.id)
+                .limit(limit)
+                .offset(offset)
+                .execution_options(yield_per=500)
+            )
+            yield b'{"count":%d,"offset":%d,"limit":%d,"users":[' % (total, offset, limit)
+            for index, row in enumerate(rows):
+                if index:
+                    yield b','
+                yield orjson.dumps({
+                    'id': row.id,
+                    'email': row.email,
+                    'perfect_days_count': row.perfect_days_count,
+                    'milestone': User.milestone_for(row.perfect_days_count)
+                })
+            yield b']}'
+        
+        return Response(stream_with_context(generate()), mimetype='application/json')
     
     @app.route('/api/register', methods=['POST'])
     def register():
@@ -283,25 +509,29 @@ def create_app():
             if 'password' not in data or not data['password']:
                 return jsonify({'error': 'Password is required'}), 400
             
-            email = data['email'].strip().lower()
+            email = normalize_email(data['email'])
             password = data['password']
             
             # Basic email validation
-            if '@' not in email or '.' not in email:
+            if email is None:
                 return jsonify({'error': 'Invalid email format'}), 400
             
-            # Check if user already exists
-            existing_user = User.query.filter_by(email=email).first()
-            
-            if existing_user:
+            if is_email_known_taken(email):
                 return jsonify({'error': 'User with this email already exists'}), 409
             
             # Hash the password
-            password_hash = generate_password_hash(password)
+            password_hash = hash_password(password)
             user = User(email=email, password_hash=password_hash)
             
+            # Rely on the unique email constraint rather than a separate lookup
             db.session.add(user)
-            db.session.commit()
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                remember_email_taken(email)
+                return jsonify({'error': 'User with this email already exists'}), 409
+            remember_email_taken(email)
             
             return jsonify({
                 'message': 'User registered successfully',
@@ -332,14 +562,17 @@ def create_app():
             password = data['password']
             
             # Find user by email
-            user = User.query.filter_by(email=email).first()
+            user = db.session.scalar(db.select(User).where(User.email == email))
             
-            if not user:
+            # Verify password, against a dummy hash for unknown emails so timing doesn't reveal them
+            password_valid = verify_password(user.password_hash if user else _DUMMY_PASSWORD_HASH, password)
+            if not user or not password_valid:
                 return jsonify({'error': 'Invalid credentials'}), 401
             
-            # Verify password
-            if not check_password_hash(user.password_hash, password):
-                return jsonify({'error': 'Invalid credentials'}), 401
+            # Upgrade legacy or outdated hashes now that the plaintext is known to be right
+            if password_needs_rehash(user.password_hash):
+                user.password_hash = hash_password(password)
+                db.session.commit()
             
             # Create JWT token
             access_token = create_access_token(identity=str(user.id))
@@ -359,8 +592,8 @@ def create_app():
     def protected():
         """Protected endpoint that requires JWT token"""
         try:
-            current_user_id = int(get_jwt_identity())
-            user = User.query.get(current_user_id)
+            current_user_id = get_current_user()
+            user = db.session.get(User, current_user_id)
             
             if not user:
                 return jsonify({'error': 'User not found'}), 404
@@ -381,7 +614,7 @@ def create_app():
     def create_habit():
         """Create a new habit for the authenticated user"""
         try:
-            current_user_id = int(get_jwt_identity())
+            current_user_id = get_current_user()
             data = request.get_json()
             
             # Validate required fields
@@ -423,13 +656,13 @@ def create_app():
             db.session.commit()
             
             # Recalculate perfect day status since a new habit affects today's requirements
-            today = date.today()
+            today = _resolve_local_date(data.get('local_date'))
             update_perfect_day_status(current_user_id, today)
             db.session.commit()
             
             return jsonify({
                 'message': 'Habit created successfully',
-                'habit': habit.to_dict()
+                'habit': habit.to_dict(today, {})
             }), 201
             
         except Exception as e:
@@ -441,37 +674,16 @@ def create_app():
     def get_habits():
         """Get all habits for the authenticated user"""
         try:
-            current_user_id = int(get_jwt_identity())
+            current_user_id = get_current_user()
             
             # Get optional local date for timezone-aware habit checking
-            local_date_str = request.args.get('local_date')
-            if local_date_str:
-                try:
-                    local_date = datetime.strptime(local_date_str, '%Y-%m-%d').date()
-                except ValueError:
-                    local_date = date.today()
-            else:
-                local_date = date.today()
-            
-            habits = Habit.query.filter_by(user_id=current_user_id).all()
-            
-            # Convert habits to dict with timezone-aware date checking
-            habits_data = []
-            for habit in habits:
-                habit_dict = habit.to_dict()
-                # Override is_due_today with timezone-aware check
-                habit_dict['is_due_today'] = habit.is_due_today(local_date)
-                # Override is_completed_today with timezone-aware check
-                completion = HabitCompletion.query.filter_by(
-                    habit_id=habit.id,
-                    completion_date=local_date
-                ).first()
-                habit_dict['is_completed_today'] = completion is not None
-                if completion:
-                    habit_dict['completion_timestamp'] = completion.completed_at.isoformat()
-                else:
-                    habit_dict['completion_timestamp'] = None
-                habits_data.append(habit_dict)
+            local_date = _resolve_local_date(request.args.get('local_date'))
+            
+            # Habits and today's completions come back from a single query
+            habits, today_map = get_user_habits_with_completions(current_user_id, local_date)
+            
+            # Convert habits to dict with timezone-aware date checking, without per-habit lookups
+            habits_data = [habit.to_dict(local_date, today_map) for habit in habits]
             
             return jsonify({
                 'habits': habits_data,
@@ -486,11 +698,11 @@ def create_app():
     def update_habit(habit_id):
         """Update an existing habit by ID for the authenticated user"""
         try:
-            current_user_id = int(get_jwt_identity())
+            current_user_id = get_current_user()
             data = request.get_json()
             
             # Find habit belonging to current user
-            habit = Habit.query.filter_by(id=habit_id, user_id=current_user_id).first()
+            habit = get_user_habit(habit_id, current_user_id)
             
             if not habit:
                 return jsonify({'error': 'Habit not found or access denied'}), 404
@@ -532,10 +744,10 @@ def create_app():
     def delete_habit(habit_id):
         """Delete a habit by ID for the authenticated user"""
         try:
-            current_user_id = int(get_jwt_identity())
+            current_user_id = get_current_user()
             
             # Find habit belonging to current user
-            habit = Habit.query.filter_by(id=habit_id, user_id=current_user_id).first()
+            habit = get_user_habit(habit_id, current_user_id)
             
             if not habit:
                 return jsonify({'error': 'Habit not found or access denied'}), 404
@@ -557,35 +769,18 @@ def create_app():
     def complete_habit(habit_id):
         """Mark a habit as completed for today"""
         try:
-            current_user_id = int(get_jwt_identity())
+            current_user_id = get_current_user()
             
             # Get timezone-aware date from frontend or use server date as fallback
             data = request.get_json() or {}
-            local_date_str = data.get('local_date')
-            
-            if local_date_str:
-                try:
-                    today = datetime.strptime(local_date_str, '%Y-%m-%d').date()
-                except ValueError:
-                    today = date.today()
-            else:
-                today = date.today()
+            today = _resolve_local_date(data.get('local_date'))
             
-            # Find habit belonging to current user
-            habit = Habit.query.filter_by(id=habit_id, user_id=current_user_id).first()
+            # Find habit belonging to current user, joining the user for the perfect-day update
+            habit = get_user_habit(habit_id, current_user_id, joinedload(Habit.user))
             
             if not habit:
                 return jsonify({'error': 'Habit not found or access denied'}), 404
             
-            # Check if already completed today
-            existing_completion = HabitCompletion.query.filter_by(
-                habit_id=habit_id,
-                completion_date=today
-            ).first()
-            
-            if existing_completion:
-                return jsonify({'error': 'Habit already completed today'}), 409
-            
             # Store UTC timestamp for consistent timezone handling
             local_timestamp = data.get('local_timestamp')
             
@@ -595,41 +790,33 @@ def create_app():
             else:
                 completion_time = datetime.utcnow()
             
-            # Create completion record with accurate timestamp
-            completion = HabitCompletion(habit_id=habit_id, completion_date=today)
-            completion.completed_at = completion_time
-            db.session.add(completion)
+            # Create completion record with accurate timestamp; the unique constraint turns a
+            # repeat completion into a no-op, so no separate existence check is needed
+            completion = db.session.scalars(
+                pg_insert(HabitCompletion)
+                .values(habit_id=habit_id, completion_date=today, completed_at=completion_time)
+                .on_conflict_do_nothing(index_elements=['habit_id', 'completion_date'])
+                .returning(HabitCompletion)
+            ).first()
+            
+            if completion is None:
+                return jsonify({'error': 'Habit already completed today'}), 409
             
             # Calculate current streak properly
-            habit.current_streak = calculate_current_streak(habit)
+            habit.current_streak = calculate_current_streak(habit, today)
             if habit.current_streak > habit.longest_streak:
                 habit.longest_streak = habit.current_streak
             
-            # Update perfect day tracking - moved to separate function to avoid duplication
-            update_perfect_day_status(current_user_id, today)
+            # Update perfect day tracking, keeping the result for the response
+            perfect_day_achieved = update_perfect_day_status(current_user_id, today)
             
             db.session.commit()
             
-            # Get perfect day status for response
-            user = User.query.get(current_user_id)
-            user_habits = Habit.query.filter_by(user_id=current_user_id).all()
-            habits_due_today = [h for h in user_habits if h.is_due_today()]
-            all_completed = all(
-                HabitCompletion.query.filter_by(habit_id=h.id, completion_date=today).first()
-                for h in habits_due_today
-            )
-            
-            # Prepare habit data with correct completion status
-            habit_data = habit.to_dict()
-            habit_data['is_completed_today'] = True
-            habit_data['completion_timestamp'] = completion.completed_at.isoformat()
-            habit_data['is_due_today'] = habit.is_due_today(today)
-            
             return jsonify({
                 'message': 'Habit completed successfully',
-                'habit': habit_data,
+                'habit': habit.to_dict(today, {habit.id: completion.completed_at}),
                 'completion': completion.to_dict(),
-                'perfect_day_achieved': all_completed and len(habits_due_today) > 0
+                'perfect_day_achieved': perfect_day_achieved
             }), 200
             
         except Exception as e:
@@ -641,55 +828,38 @@ def create_app():
     def uncomplete_habit(habit_id):
         """Unmark a habit as completed for today"""
         try:
-            current_user_id = int(get_jwt_identity())
+            current_user_id = get_current_user()
             
             # Get timezone-aware date from frontend or use server date as fallback
             data = request.get_json() or {}
-            local_date_str = data.get('local_date')
+            today = _resolve_local_date(data.get('local_date'))
             
-            if local_date_str:
-                try:
-                    today = datetime.strptime(local_date_str, '%Y-%m-%d').date()
-                except ValueError:
-                    today = date.today()
-            else:
-                today = date.today()
-            
-            # Find habit belonging to current user
-            habit = Habit.query.filter_by(id=habit_id, user_id=current_user_id).first()
+            # Find habit belonging to current user, joining the user for the perfect-day update
+            habit = get_user_habit(habit_id, current_user_id, joinedload(Habit.user))
             
             if not habit:
                 return jsonify({'error': 'Habit not found or access denied'}), 404
             
-            # Find today's completion
-            completion = HabitCompletion.query.filter_by(
-                habit_id=habit_id,
-                completion_date=today
-            ).first()
+            # Remove today's completion record without loading it first
+            deleted = db.session.execute(db.delete(HabitCompletion).where(
+                HabitCompletion.habit_id == habit_id,
+                HabitCompletion.completion_date == today
+            ))
             
-            if not completion:
+            if not deleted.rowcount:
                 return jsonify({'error': 'Habit not completed today'}), 404
             
-            # Remove completion record
-            db.session.delete(completion)
-            
             # Recalculate current streak properly
-            habit.current_streak = calculate_current_streak(habit)
+            habit.current_streak = calculate_current_streak(habit, today)
             
             # Update perfect day tracking after uncompleting habit
             update_perfect_day_status(current_user_id, today)
             
             db.session.commit()
             
-            # Prepare habit data with correct completion status
-            habit_data = habit.to_dict()
-            habit_data['is_completed_today'] = False
-            habit_data['completion_timestamp'] = None
-            habit_data['is_due_today'] = habit.is_due_today(today)
-            
             return jsonify({
                 'message': 'Habit uncompleted successfully',
-                'habit': habit_data
+                'habit': habit.to_dict(today, {})
             }), 200
             
         except Exception as e:
@@ -701,20 +871,21 @@ def create_app():
     def get_habit_history(habit_id):
         """Get habit completion history for calendar/heatmap view"""
         try:
-            current_user_id = int(get_jwt_identity())
+            current_user_id = get_current_user()
             
             # Verify habit belongs to user
-            habit = Habit.query.filter_by(id=habit_id, user_id=current_user_id).first()
+            habit = get_user_habit(habit_id, current_user_id)
             if not habit:
                 return jsonify({'error': 'Habit not found or access denied'}), 404
             
             # Get optional date range parameters
             start_date_str = request.args.get('start_date')
             end_date_str = request.args.get('end_date')
+            today = _resolve_local_date(request.args.get('local_date'))
             
             # Default to last 30 days if no range provided
             if not start_date_str or not end_date_str:
-                end_date = date.today()
+                end_date = today
                 start_date = end_date - timedelta(days=30)
             else:
                 try:
@@ -723,47 +894,53 @@ def create_app():
                 except ValueError:
                     return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
             
-            # Get all completions for the habit in the date range
-            completions = HabitCompletion.query.filter(
+            # Completed dates in the range, as a set for quick lookup
+            completed_dates = set(db.session.scalars(db.select(HabitCompletion.completion_date).where(
                 HabitCompletion.habit_id == habit_id,
                 HabitCompletion.completion_date >= start_date,
                 HabitCompletion.completion_date <= end_date
-            ).all()
-            
-            # Create a set of completed dates for quick lookup
-            completed_dates = {completion.completion_date for completion in completions}
-            
-            # Generate daily status for each date in range
-            history = []
-            current_date = start_date
-            
-            while current_date <= end_date:
-                # Determine status for this date
-                if current_date in completed_dates:
-                    status = 'completed'
-                elif current_date < date.today():
-                    # Check if habit was due on this date based on target_days
-                    is_due = True  # Simplified - could add more logic for weekdays/custom
-                    status = 'missed' if is_due else 'not_logged'
-                else:
-                    status = 'not_logged'
-                
-                history.append({
-                    'date': current_date.isoformat(),
-                    'status': status
-                })
-                
-                current_date += timedelta(days=1)
+            )))
             
-            return jsonify({
+            # Past days only count as missed when the habit was due on them
+            due_mask = habit.target_weekday_mask
+            habit_start = habit.start_date
+            
+            total_days = (end_date - start_date).days + 1
+            # Header fields are known up front; history is appended as it is generated.
+            # Dates go to orjson as-is; it writes them as ISO strings natively.
+            header = orjson.dumps({
                 'habit_id': habit_id,
                 'habit_name': habit.name,
-                'start_date': start_date.isoformat(),
-                'end_date': end_date.isoformat(),
-                'total_days': len(history),
-                'completed_days': len([h for h in history if h['status'] == 'completed']),
-                'history': history
-            }), 200
+                'start_date': start_date,
+                'end_date': end_date,
+                'total_days': max(total_days, 0),
+                'completed_days': len(completed_dates)
+            })
+            
+            def day_status(current_date):
+                return {
+                    'date': current_date,
+                    'status': 'completed' if current_date in completed_dates else (
+                        'missed' if habit_start <= current_date < today and due_mask >> current_date.weekday() & 1
+                        else 'not_logged'
+                    )
+                }
+            
+            def generate():
+                # Stream the history in batches of days: a year-long range never sits in memory
+                # as one list, and each batch is a single write rather than one per day
+                yield header[:-1] + b',"history":['
+                for batch_start in range(0, total_days, HISTORY_BATCH_DAYS):
+                    batch = [
+                        day_status(start_date + timedelta(days=offset))
+                        for offset in range(batch_start, min(batch_start + HISTORY_BATCH_DAYS, total_days))
+                    ]
+                    # Drop the list brackets so consecutive batches join into one array
+                    chunk = orjson.dumps(batch)[1:-1]
+                    yield b',' + chunk if batch_start else chunk
+                yield b']}'
+            
+            return Response(generate(), mimetype='application/json')
             
         except Exception as e:
             return jsonify({'error': f'Failed to get habit history: {str(e)}'}), 500
@@ -772,23 +949,35 @@ def create_app():
     def create_user():
         """Create a new user (legacy endpoint)"""
         try:
-            data = request.get_json()
+            # Malformed bodies fall through to the 400 below instead of a 500
+            data = request.get_json(silent=True)
             
-            if not data or 'email' not in data or 'password' not in data:
+            if not isinstance(data, dict) or 'email' not in data or 'password' not in data:
                 return jsonify({'error': 'Email and password are required'}), 400
             
-            # Check if user already exists
-            existing_user = User.query.filter_by(email=data['email']).first()
+            # Normalize and validate as register does, so the cache and login see the same email
+            email = normalize_email(data['email'])
+            if email is None:
+                return jsonify({'error': 'Invalid email format'}), 400
+            if not isinstance(data['password'], str):
+                return jsonify({'error': 'Passwords must be strings'}), 400
             
-            if existing_user:
+            if is_email_known_taken(email):
                 return jsonify({'error': 'User with this email already exists'}), 409
             
             # Hash the password
-            password_hash = generate_password_hash(data['password'])
-            user = User(email=data['email'], password_hash=password_hash)
+            password_hash = hash_password(data['password'])
+            user = User(email=email, password_hash=password_hash)
             
+            # Rely on the unique email constraint rather than a separate lookup
             db.session.add(user)
-            db.session.commit()
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                remember_email_taken(email)
+                return jsonify({'error': 'User with this email already exists'}), 409
+            remember_email_taken(email)
             
             return jsonify({
                 'message': 'User created successfully',
@@ -799,14 +988,71 @@ def create_app():
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
     
+    @app.route('/api/users/bulk', methods=['POST'])
+    @jwt_required()
+    def create_users_bulk():
+        """Create many users in a single INSERT, skipping emails that already exist"""
+        try:
+            data = request.get_json(silent=True)
+            
+            if not isinstance(data, list) or not data:
+                return jsonify({'error': 'Request body must be a non-empty list of users'}), 400
+            
+            limit = app.config['BULK_USERS_MAX']
+            if len(data) > limit:
+                return jsonify({'error': f'At most {limit} users can be created per request'}), 400
+            
+            # Keep the first password per email and skip emails already known to be taken
+            new_users = {}
+            for entry in data:
+                if not isinstance(entry, dict) or not entry.get('email') or not entry.get('password'):
+                    return jsonify({'error': 'Email and password are required for every user'}), 400
+                # Normalize and validate exactly as register does, so bulk-created users can log in
+                email = normalize_email(entry['email'])
+                if email is None:
+                    return jsonify({'error': 'Invalid email format'}), 400
+                if not isinstance(entry['password'], str):
+                    return jsonify({'error': 'Passwords must be strings'}), 400
+                if email not in new_users and not is_email_known_taken(email):
+                    new_users[email] = entry['password']
+            
+            created = []
+            if new_users:
+                password_hashes = hash_passwords(new_users.values())
+                result = db.session.execute(
+                    pg_insert(User)
+                    .on_conflict_do_nothing(index_elements=['email'])
+                    .returning(User.id, User.email),
+                    [
+                        {'email': email, 'password_hash': password_hash}
+                        for email, password_hash in zip(new_users, password_hashes)
+                    ]
+                )
+                created = [{'id': row.id, 'email': row.email} for row in result]
+                db.session.commit()
+            
+            for email in new_users:
+                remember_email_taken(email)
+            
+            return jsonify({
+                'message': 'Users created successfully',
+                'users': created,
+                'count': len(created),
+                'skipped': len(data) - len(created)
+            }), 201
+            
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+    
     @app.errorhandler(404)
     def not_found(error):
-        return jsonify({'error': 'Endpoint not found'}), 404
+        return Response(not_found_body, status=404, mimetype='application/json')
     
     @app.errorhandler(500)
     def internal_error(error):
         db.session.rollback()
-        return jsonify({'error': 'Internal server error'}), 500
+        return Response(internal_error_body, status=500, mimetype='application/json')
     
     return app
 
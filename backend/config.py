@@ -4,18 +4,32 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def database_uri():
+    """Read DATABASE_URL, pointing plain PostgreSQL URLs at the psycopg 3 driver"""
+    uri = os.environ.get('DATABASE_URL') or 'postgresql://localhost/flask_react_app'
+    for scheme in ('postgresql://', 'postgres://'):
+        if uri.startswith(scheme):
+            return 'postgresql+psycopg://' + uri[len(scheme):]
+    return uri
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'postgresql://localhost/flask_react_app'
+    SQLALCHEMY_DATABASE_URI = database_uri()
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ENGINE_OPTIONS = {
+        # One connection per gunicorn thread: a process never needs more, and workers x threads
+        # connections in total must stay under the server's max_connections
+        'pool_size': int(os.environ.get('GUNICORN_THREADS', 16)),
+        'max_overflow': 0,
         'pool_pre_ping': True,
         'pool_recycle': 300,
         'pool_reset_on_return': 'commit',
         'connect_args': {
             "sslmode": "prefer",
             "application_name": "habit_tracker",
-            "connect_timeout": 10
+            "connect_timeout": 10,
+            # Server-side prepare statements after they run this many times on a connection
+            "prepare_threshold": 3
         }
     }
     
@@ -24,5 +38,24 @@ class Config:
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
     JWT_ALGORITHM = 'HS256'
     
+    # Argon2id cost parameters for new password hashes; the defaults follow the OWASP baseline
+    # (19 MiB, 2 passes, 1 lane) and can be lowered through the environment for test runs
+    ARGON2_TIME_COST = int(os.environ.get('ARGON2_TIME_COST', 2))
+    ARGON2_MEMORY_COST = int(os.environ.get('ARGON2_MEMORY_COST', 19456))
+    ARGON2_PARALLELISM = int(os.environ.get('ARGON2_PARALLELISM', 1))
+    
+    # Largest batch accepted by POST /api/users/bulk
+    BULK_USERS_MAX = 100
+    
+    # Seconds a serialized /api/status response is reused before re-pinging the database
+    STATUS_CACHE_SECONDS = 2.0
+    
+    # Count the SQL statements each request runs and log statements repeated more than the threshold
+    DB_QUERY_LOGGING = os.environ.get('DB_QUERY_LOGGING') == '1'
+    DB_QUERY_LOG_N1_THRESHOLD = int(os.environ.get('DB_QUERY_LOG_N1_THRESHOLD', 3))
+    
+    # Make relationship lazy loads raise instead of querying, so N+1 patterns fail loudly in development
+    DB_RAISELOAD = os.environ.get('DB_RAISELOAD') == '1'
+    
     # CORS settings
     CORS_ORIGINS = ['http://localhost:3000', 'http://localhost:5000']
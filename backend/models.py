@@ -1,9 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import validates
 from datetime import date, datetime
+from functools import lru_cache
 import uuid
-import json
 
-db = SQLAlchemy()
+# Keep loaded attributes after commit so responses built from just-saved objects don't re-SELECT them
+db = SQLAlchemy(session_options={'expire_on_commit': False})
 
 """
 Database Models Module
@@ -16,6 +18,7 @@ Models:
 - User: Manages user accounts and perfect day tracking
 - Habit: Defines habit properties and completion rules
 - HabitCompletion: Tracks individual habit completions
+- PerfectDay: Records the dates on which a user completed every due habit
 
 The models use SQLAlchemy for ORM functionality and include methods for
 serialization, validation, and business logic implementation.
@@ -32,68 +35,57 @@ class User(db.Model):
         email (str): User's email address (unique)
         password_hash (str): Hashed password
         perfect_days_count (int): Number of days all habits were completed
-        perfect_days_dates (str): JSON string of perfect day dates
         habits (relationship): One-to-many relationship with Habit model
+        perfect_days (relationship): One-to-many relationship with PerfectDay model
     """
     __tablename__ = 'users'
     
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
     perfect_days_count = db.Column(db.Integer, default=0)
-    perfect_days_dates = db.Column(db.Text, default='')  # Store JSON array of date strings
     
-    # Relationship to habits
+    # Relationships to habits and perfect days
     habits = db.relationship('Habit', backref='user', lazy=True, cascade='all, delete-orphan')
+    perfect_days = db.relationship('PerfectDay', lazy=True, cascade='all, delete-orphan')
     
     def __init__(self, email, password_hash):
         self.email = email
         self.password_hash = password_hash
         self.perfect_days_count = 0
-        self.perfect_days_dates = ''
-    
-    def get_perfect_days_set(self):
-        """Get the set of perfect days as a Python set"""
-        if not self.perfect_days_dates:
-            return set()
-        try:
-            return set(json.loads(self.perfect_days_dates))
-        except:
-            return set()
     
     def add_perfect_day(self, date_str):
-        """Add a date to the perfect days set"""
-        perfect_days = self.get_perfect_days_set()
-        perfect_days.add(date_str)
-        self.perfect_days_dates = json.dumps(list(perfect_days))
-        self.perfect_days_count = len(perfect_days)
+        """Record a date as a perfect day; callers check has_perfect_day first"""
+        db.session.add(PerfectDay(user_id=self.id, day=date.fromisoformat(date_str)))
+        # Increment in SQL so concurrent requests can't overwrite each other's count
+        self.perfect_days_count = User.perfect_days_count + 1
     
     def remove_perfect_day(self, date_str):
-        """Remove a date from the perfect days set"""
-        perfect_days = self.get_perfect_days_set()
-        perfect_days.discard(date_str)
-        self.perfect_days_dates = json.dumps(list(perfect_days))
-        self.perfect_days_count = len(perfect_days)
+        """Remove a date from the perfect days"""
+        deleted = db.session.execute(db.delete(PerfectDay).where(
+            PerfectDay.user_id == self.id,
+            PerfectDay.day == date.fromisoformat(date_str)
+        ))
+        if deleted.rowcount:
+            self.perfect_days_count = User.perfect_days_count - deleted.rowcount
     
     def has_perfect_day(self, date_str):
-        """Check if a specific date is in the perfect days set"""
-        return date_str in self.get_perfect_days_set()
+        """Check if a specific date is a perfect day with an indexed primary key lookup"""
+        return db.session.scalar(db.select(db.exists().where(
+            PerfectDay.user_id == self.id,
+            PerfectDay.day == date.fromisoformat(date_str)
+        )))
 
     def get_next_milestone(self):
         """Get the next milestone and progress towards it with automatic 50-day increments"""
-        current_count = self.perfect_days_count
-        
-        # Calculate the next milestone target based on 50-day increments
-        # Bronze (0-49), Silver (50-99), Gold (100-149), Diamond (150+)
-        if current_count < 50:
-            next_milestone = 50
-        elif current_count < 100:
-            next_milestone = 100
-        elif current_count < 150:
-            next_milestone = 150
-        else:
-            # For Diamond levels (150+), continue in 50-day increments
-            next_milestone = ((current_count // 50) + 1) * 50
+        return User.milestone_for(self.perfect_days_count)
+    
+    @staticmethod
+    def milestone_for(current_count):
+        """Milestone progress for a perfect day count, usable without a loaded User"""
+        # Milestones fall every 50 perfect days; the next one is the first multiple of 50 above the count
+        # (Bronze 0-49, Silver 50-99, Gold 100-149, Diamond 150+)
+        next_milestone = (current_count // 50 + 1) * 50
         
         progress_percentage = (current_count / next_milestone) * 100
         days_remaining = next_milestone - current_count
@@ -117,6 +109,21 @@ class User(db.Model):
     def __repr__(self):
         return f'<User {self.email}>'
 
+WEEKDAY_NAMES = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+EVERY_DAY_MASK = 0b1111111
+WEEKDAYS_MASK = 0b0011111  # Monday to Friday
+
+@lru_cache(maxsize=256)
+def weekday_mask(target_days):
+    """Bitmask of the weekdays a target_days value schedules a habit on (bit 0 = Monday)"""
+    if target_days == 'every_day':
+        return EVERY_DAY_MASK
+    if target_days == 'weekdays':
+        return WEEKDAYS_MASK
+    # Custom days like "monday,wednesday,friday" or a single day name
+    selected_days = {day.strip().lower() for day in target_days.split(',')}
+    return sum(1 << i for i, name in enumerate(WEEKDAY_NAMES) if name in selected_days)
+
 class Habit(db.Model):
     """
     Habit Model
@@ -130,6 +137,7 @@ class Habit(db.Model):
         user_id (int): Foreign key to User model
         name (str): Habit name/description
         target_days (str): Schedule pattern ('every_day', 'weekdays', or custom)
+        target_weekday_mask (int): Weekdays the habit is due on, kept in sync with target_days
         start_date (date): Date when habit tracking begins
         current_streak (int): Current consecutive completion streak
         longest_streak (int): Longest achieved streak
@@ -138,10 +146,12 @@ class Habit(db.Model):
     __tablename__ = 'habits'
     
     id = db.Column(db.Integer, primary_key=True)
-    unique_id = db.Column(db.String(36), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # Native 16-byte uuid on PostgreSQL, still read and written as the hyphenated string
+    unique_id = db.Column(db.Uuid(as_uuid=False), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     name = db.Column(db.String(200), nullable=False)
     target_days = db.Column(db.String(50), nullable=False)  # 'every_day', 'weekdays', 'custom'
+    target_weekday_mask = db.Column(db.SmallInteger, nullable=False, server_default=str(EVERY_DAY_MASK))
     start_date = db.Column(db.Date, nullable=False)
     current_streak = db.Column(db.Integer, default=0)
     longest_streak = db.Column(db.Integer, default=0)
@@ -150,7 +160,6 @@ class Habit(db.Model):
     completions = db.relationship('HabitCompletion', backref='habit', lazy=True, cascade='all, delete-orphan')
     
     def __init__(self, user_id, name, target_days, start_date):
-        self.unique_id = str(uuid.uuid4())
         self.user_id = user_id
         self.name = name
         self.target_days = target_days
@@ -158,66 +167,62 @@ class Habit(db.Model):
         self.current_streak = 0
         self.longest_streak = 0
     
+    @validates('target_days')
+    def validate_target_days(self, key, target_days):
+        """Keep the weekday mask in sync whenever target_days is assigned"""
+        self.target_weekday_mask = weekday_mask(target_days)
+        return target_days
+    
     def is_due_today(self, check_date=None):
         """Check if habit is due today based on target_days and start_date"""
         today = check_date if check_date else date.today()
         
-        # First check if today is on or after the start date
-        if today < self.start_date:
-            return False
-        
-        weekday = today.weekday()  # 0=Monday, 6=Sunday
-        
-        if self.target_days == 'every_day':
-            return True
-        elif self.target_days == 'weekdays':
-            return weekday < 5  # Monday to Friday
-        else:
-            # Handle custom days like "monday,wednesday,friday"
-            if ',' in self.target_days:
-                weekday_names = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-                selected_days = [day.strip().lower() for day in self.target_days.split(',')]
-                today_name = weekday_names[weekday]
-                return today_name in selected_days
-            
-            # For single custom day
-            weekday_names = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-            today_name = weekday_names[weekday]
-            return self.target_days.lower() == today_name
-    
-    def is_completed_today(self):
-        """Check if habit is completed today"""
-        today = date.today()
-        completion = HabitCompletion.query.filter_by(
-            habit_id=self.id,
-            completion_date=today
-        ).first()
-        return completion is not None
-    
-    def get_completion_timestamp_today(self):
+        # Due from the start date onward, on the weekdays set in the mask (0=Monday, 6=Sunday)
+        return today >= self.start_date and bool(self.target_weekday_mask >> today.weekday() & 1)
+    
+    def is_completed_today(self, today_map=None, check_date=None):
+        """Check if habit is completed today; a today_map from HabitCompletion.today_map_for_user skips the query"""
+        if today_map is not None:
+            return self.id in today_map
+        today = check_date if check_date else date.today()
+        return db.session.scalar(db.select(db.exists().where(
+            HabitCompletion.habit_id == self.id,
+            HabitCompletion.completion_date == today
+        )))
+    
+    def get_completion_timestamp_today(self, today_map=None, check_date=None):
         """Get the completion timestamp for today if completed"""
-        today = date.today()
-        completion = HabitCompletion.query.filter_by(
-            habit_id=self.id,
-            completion_date=today
-        ).first()
+        if today_map is not None:
+            completed_at = today_map.get(self.id)
+        else:
+            today = check_date if check_date else date.today()
+            # Select just the timestamp rather than hydrating a HabitCompletion
+            completed_at = db.session.scalar(db.select(HabitCompletion.completed_at).where(
+                HabitCompletion.habit_id == self.id,
+                HabitCompletion.completion_date == today
+            ))
         # Return UTC timestamp with 'Z' suffix for consistent parsing
-        return completion.completed_at.isoformat() + 'Z' if completion else None
+        return completed_at.isoformat() + 'Z' if completed_at else None
 
-    def to_dict(self):
-        completion_timestamp = self.get_completion_timestamp_today()
+    def to_dict(self, today=None, today_map=None):
+        """Serialize the habit; pass today's {habit_id: completed_at} map to share one lookup across habits"""
+        # Read the clock once and hand the same date to every check below
+        if today is None:
+            today = date.today()
+        if today_map is None:
+            today_map = HabitCompletion.today_map_for_user(self.user_id, today)
         return {
             'id': self.id,
             'unique_id': self.unique_id,
             'user_id': self.user_id,
             'name': self.name,
             'target_days': self.target_days,
-            'start_date': self.start_date.isoformat() if isinstance(self.start_date, date) else self.start_date,
+            'start_date': self.start_date,  # orjson encodes dates as ISO strings
             'current_streak': self.current_streak,
             'longest_streak': self.longest_streak,
-            'is_due_today': self.is_due_today(),
-            'is_completed_today': self.is_completed_today(),
-            'completion_timestamp': completion_timestamp
+            'is_due_today': self.is_due_today(today),
+            'is_completed_today': self.is_completed_today(today_map),
+            'completion_timestamp': self.get_completion_timestamp_today(today_map)
         }
     
     def __repr__(self):
@@ -245,20 +250,51 @@ class HabitCompletion(db.Model):
     completed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
     # Ensure one completion per habit per day
+    # The unique constraint's index also serves every (habit_id, completion_date) lookup
     __table_args__ = (db.UniqueConstraint('habit_id', 'completion_date', name='_habit_completion_uc'),)
     
-    def __init__(self, habit_id, completion_date=None):
+    def __init__(self, habit_id, completion_date=None, completed_at=None):
         self.habit_id = habit_id
         self.completion_date = completion_date or date.today()
-        self.completed_at = datetime.utcnow()
+        # Callers creating many completions can share one timestamp instead of reading the clock per row
+        self.completed_at = completed_at or datetime.utcnow()
+    
+    @classmethod
+    def today_map_for_user(cls, user_id, today):
+        """Map each of a user's habits completed on a date to its completed_at, in one query"""
+        rows = db.session.execute(
+            db.select(cls.habit_id, cls.completed_at)
+            .join(Habit)
+            .where(Habit.user_id == user_id, cls.completion_date == today)
+        )
+        return {habit_id: completed_at for habit_id, completed_at in rows}
     
     def to_dict(self):
         return {
             'id': self.id,
             'habit_id': self.habit_id,
-            'completion_date': self.completion_date.isoformat(),
+            'completion_date': self.completion_date,
             'completed_at': self.completed_at.isoformat()
         }
     
     def __repr__(self):
         return f'<HabitCompletion {self.habit_id} on {self.completion_date}>'
+
+
+class PerfectDay(db.Model):
+    """
+    PerfectDay Model
+    
+    Records a date on which a user completed every habit due that day.
+    
+    Attributes:
+        user_id (int): Foreign key to User model, part of the primary key
+        day (date): The perfect day, part of the primary key
+    """
+    __tablename__ = 'perfect_days'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    
+    def __repr__(self):
+        return f'<PerfectDay {self.user_id} on {self.day}>'
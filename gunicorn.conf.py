@@ -0,0 +1,25 @@
+"""
+Gunicorn configuration for serving the Flask backend in production
+
+Usage:
+    gunicorn 'backend.app:create_app()'
+
+Gunicorn picks this file up automatically from the working directory.
+Settings can be overridden with the environment variables below.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('FLASK_PORT', '5001')}"
+
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+# The app sizes each worker's database pool to match
+os.environ['GUNICORN_THREADS'] = str(threads)
+
+# One process per core, threads to overlap database waits; by default the worker count is
+# capped so workers x threads stays under PostgreSQL's default max_connections of 100
+workers = int(os.environ.get('GUNICORN_WORKERS', max(1, min(os.cpu_count() or 1, 90 // threads))))
+# The app splits its password-hashing threads between worker processes using this
+os.environ['GUNICORN_WORKERS'] = str(workers)
+
+keepalive = 5
@@ -2,18 +2,54 @@
 """
 Flask application runner
 This script starts the Flask backend server on port 5001
+
+The database schema is migrated to the latest revision before serving.
+The Werkzeug dev server (with the debugger and reloader) is only used in
+development. When Express runs in production (NODE_ENV=production) the
+backend is served by gunicorn using gunicorn.conf.py instead.
 """
 import os
 import sys
-from backend.app import create_app
+
+# Revision matching the tables the app created with create_all before migrations existed
+INITIAL_REVISION = '330ab043d03e'
+
+
+def migrate_database(app):
+    """Upgrade the schema to head, stamping pre-migration databases at the initial revision first"""
+    from flask_migrate import stamp, upgrade
+    from sqlalchemy import inspect
+    from backend.models import db
+
+    with app.app_context():
+        tables = inspect(db.engine).get_table_names()
+        if 'users' in tables and 'alembic_version' not in tables:
+            print(f"Stamping existing database at revision {INITIAL_REVISION}...")
+            stamp(revision=INITIAL_REVISION)
+        upgrade()
+        # Don't hand pooled connections on to gunicorn or the reloader child
+        db.engine.dispose()
+
 
 if __name__ == '__main__':
-    # Create Flask app
-    app = create_app()
-    
+    from backend.app import create_app
+
     # Get port from environment or use 5001
     port = int(os.environ.get('FLASK_PORT', 5001))
-    
+
+    # Migrate once; the dev reloader re-runs this script in a child process that skips it
+    if not os.environ.get('WERKZEUG_RUN_MAIN'):
+        migrate_database(create_app())
+
+    if os.environ.get('NODE_ENV') == 'production':
+        # Replace this process with gunicorn; it reads FLASK_PORT from gunicorn.conf.py
+        print(f"Starting Flask backend with gunicorn on port {port}...")
+        sys.stdout.flush()
+        os.execvp('gunicorn', ['gunicorn', 'backend.app:create_app()'])
+
+    # Create Flask app
+    app = create_app()
+
     # Run the application
     print(f"Starting Flask backend on port {port}...")
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=True)
@@ -1,6 +1,7 @@
-import type { Express } from "express";
+import type { Express, Request, Response, NextFunction } from "express";
 import { createServer, type Server } from "http";
 import { spawn } from "child_process";
+import zlib from "zlib";
 import { log } from "./vite";
 
 /**
@@ -15,8 +16,39 @@ import { log } from "./vite";
  * - API request proxying
  * - Error handling and logging
  * - Authentication header forwarding
+ * - Response compression for API clients
  */
 
+// Smaller bodies aren't worth the compression overhead
+const MIN_COMPRESS_BYTES = 1024;
+
+/**
+ * Compresses API response bodies for clients that accept br or gzip
+ * This is where bytes leave the host: fetch decompresses Flask's responses on the
+ * loopback hop, so compressing in Flask would never reach the browser
+ * @param {Request} req - Express request object
+ * @param {Response} res - Express response object
+ * @param {NextFunction} next - Next middleware
+ */
+function compressResponses(req: Request, res: Response, next: NextFunction) {
+  const send = res.send.bind(res);
+  res.send = (body?: any) => {
+    const encoding = req.acceptsEncodings('br', 'gzip');
+    // Only bodies with a content type already set (res.json sets one); a Buffer would otherwise go out as octet-stream
+    if (typeof body === 'string' && encoding && res.getHeader('Content-Type') && Buffer.byteLength(body) >= MIN_COMPRESS_BYTES) {
+      const raw = Buffer.from(body);
+      const compressed = encoding === 'br'
+        ? zlib.brotliCompressSync(raw, { params: { [zlib.constants.BROTLI_PARAM_QUALITY]: 4 } })
+        : zlib.gzipSync(raw);
+      res.setHeader('Content-Encoding', encoding);
+      res.vary('Accept-Encoding');
+      return send(compressed);
+    }
+    return send(body);
+  };
+  next();
+}
+
 /**
  * Registers routes and initializes the server
  * @param {Express} app - Express application instance
@@ -46,6 +78,9 @@ export async function registerRoutes(app: Express): Promise<Server> {
   // Wait for Flask to start
   await new Promise(resolve => setTimeout(resolve, 3000));
 
+  // Compress proxied API responses on their way to the browser
+  app.use('/api', compressResponses);
+
   // Proxy API requests to Flask backend
   app.use('/api', async (req, res) => {
     try {